@@ -0,0 +1,129 @@
+"""
+Boot-time profiling and warm-up for the application server.
+
+``gunicorn.conf.py`` preloads the WSGI app in the master, calls
+``warm_up()`` and freezes the GC before forking, so workers share the
+imported modules and warmed caches copy-on-write. Run
+``python -m config.boot`` to print an import-time and boot-time breakdown.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+STARTED = time.perf_counter()
+
+timings = []
+
+
+@contextmanager
+def timed(label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((label, time.perf_counter() - start))
+
+
+def warm_up():
+    from django.apps import apps
+    from django.db import connections
+    from django.urls import get_resolver
+    from PIL import Image
+
+    with timed('url resolver'):
+        get_resolver().reverse_dict
+
+    with timed('model meta'):
+        for model in apps.get_models():
+            model._meta.get_fields()
+
+    with timed('pillow plugins'):
+        Image.init()
+
+    with timed('pedigree graph'):
+        from kennel.pedigree import graph
+        graph.load()
+
+    # Connections must not be shared with forked workers.
+    connections.close_all()
+
+
+def warm_worker():
+    """Open the worker's own connections and run the catalog querysets once.
+
+    Runs in each worker before it accepts requests; connections can't be
+    inherited from the master, so this is what takes the first connect and
+    query off the first live request. Returns the elapsed seconds.
+    """
+    from django.db import connections
+
+    from kennel.routers import REPLICA, replica_reads
+    from kennel.views import (DogDetailView, GraduateListView, LitterDetailView, LitterListView,
+                              ProducerListView, PuppyListView)
+
+    start = time.perf_counter()
+    connections['default'].ensure_connection()
+    with replica_reads():
+        if REPLICA in connections:
+            connections[REPLICA].ensure_connection()
+        for view in (PuppyListView, GraduateListView, ProducerListView):
+            list(view().get_queryset()[:1])
+        list(LitterListView.queryset[:1])
+        list(DogDetailView.queryset[:1])
+        list(LitterDetailView.queryset[:1])
+    return time.perf_counter() - start
+
+
+def report():
+    lines = [f'{label:<24} {seconds * 1000:>9.1f} ms' for label, seconds in timings]
+    lines.append(f'{"total":<24} {(time.perf_counter() - STARTED) * 1000:>9.1f} ms')
+    return lines
+
+
+re_importtime = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_breakdown(modules=('config.wsgi', 'config.urls')):
+    """Import time per top-level package, via ``-X importtime``.
+
+    The URLconf is included because ``warm_up()`` loads it (and with it
+    the views) before workers fork.
+
+    Self times are summed across every nesting depth, so a package gets
+    the time spent in its own modules no matter who imported them.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(modules)}'],
+        capture_output=True, text=True, check=True,
+    )
+    totals = defaultdict(int)
+    for line in result.stderr.splitlines():
+        match = re_importtime.match(line)
+        if match:
+            totals[match[4].split('.')[0]] += int(match[1])
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    print('Import time (self time per top-level package):')
+    for package, microseconds in import_breakdown()[:15]:
+        print(f'  {package:<24} {microseconds / 1000:>9.1f} ms')
+
+    import django
+    with timed('django setup'):
+        django.setup()
+    warm_up()
+
+    print('Boot phases:')
+    for line in report():
+        print(f'  {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'kennel.middleware.CompressionMiddleware',
+    'kennel.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,6 +99,27 @@ DATABASES = {
     }
 }
 
+# Optional streaming replica for the catalog read views (kennel.routers)
+
+if env("POSTGRES_REPLICA_HOST", default=""):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": env("POSTGRES_REPLICA_HOST"),
+        "PORT": env("POSTGRES_REPLICA_PORT", default="5432"),
+        # The lag probe connects from inside a request, so an unreachable
+        # replica has to fail fast rather than hang the worker.
+        "OPTIONS": {"connect_timeout": env.int("POSTGRES_REPLICA_CONNECT_TIMEOUT", default=2)},
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["kennel.routers.PrimaryReplicaRouter"]
+
+# Reads stay on the primary this long after a client writes
+REPLICA_STICKY_SECONDS = env.int("REPLICA_STICKY_SECONDS", default=10)
+# Fall back to the primary when the replica is further behind than this
+REPLICA_MAX_LAG = env.float("REPLICA_MAX_LAG", default=5.0)
+REPLICA_LAG_CHECK_INTERVAL = 5
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -120,9 +143,25 @@ REST_FRAMEWORK = {
     # or allow read-only access for unauthenticated users.
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
-    ]
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "kennel.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# Response compression (kennel.middleware.CompressionMiddleware)
+
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_CONTENT_TYPES = ['application/json']
+COMPRESSION_CACHE_SIZE = env.int('COMPRESSION_CACHE_SIZE', default=256)
+COMPRESSION_BROTLI_QUALITY = 5
+COMPRESSION_GZIP_LEVEL = 6
+
+# Upper bound on dogs + litters per /api/v1/batch/ request
+
+BATCH_MAX_ITEMS = env.int('BATCH_MAX_ITEMS', default=50)
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -142,3 +181,60 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Object storage for media
+# With a bucket configured, uploads and imagekit cachefiles go to S3 (or any
+# S3-compatible service such as MinIO). URLs are built from
+# AWS_S3_CUSTOM_DOMAIN without signing, and cachefiles are generated when the
+# source is saved instead of being checked for existence on every .url.
+
+AWS_STORAGE_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME', default='')
+
+if AWS_STORAGE_BUCKET_NAME:
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+        },
+        'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        },
+    }
+
+    AWS_S3_ACCESS_KEY_ID = env('AWS_S3_ACCESS_KEY_ID')
+    AWS_S3_SECRET_ACCESS_KEY = env('AWS_S3_SECRET_ACCESS_KEY')
+    AWS_S3_REGION_NAME = env('AWS_S3_REGION_NAME', default='us-east-1')
+    AWS_S3_ENDPOINT_URL = env('AWS_S3_ENDPOINT_URL', default=None)
+    # Endpoint reachable from browsers, for presigned uploads; defaults to AWS_S3_ENDPOINT_URL.
+    AWS_S3_PUBLIC_ENDPOINT_URL = env('AWS_S3_PUBLIC_ENDPOINT_URL', default=None)
+    AWS_S3_CUSTOM_DOMAIN = env('AWS_S3_CUSTOM_DOMAIN', default=None)
+    AWS_S3_URL_PROTOCOL = env('AWS_S3_URL_PROTOCOL', default='https:')
+    AWS_S3_ADDRESSING_STYLE = env('AWS_S3_ADDRESSING_STYLE', default='auto')
+    AWS_QUERYSTRING_AUTH = False
+    AWS_S3_FILE_OVERWRITE = False
+    AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'public, max-age=2592000'}
+
+    IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY = 'imagekit.cachefiles.strategies.Optimistic'
+
+# Uploaded originals are re-encoded to fit within this many pixels per side
+
+MEDIA_MAX_DIMENSION = env.int('MEDIA_MAX_DIMENSION', default=2560)
+MEDIA_JPEG_QUALITY = env.int('MEDIA_JPEG_QUALITY', default=88)
+
+DIRECT_UPLOAD_MAX_SIZE = env.int('DIRECT_UPLOAD_MAX_SIZE', default=50 * 1024 * 1024)
+DIRECT_UPLOAD_EXPIRES = 600
+
+# Pedigree graph
+# In-process graphs are patched by signals; other workers reload after this many seconds.
+
+PEDIGREE_GRAPH_TTL = env.int('PEDIGREE_GRAPH_TTL', default=300)
+
+# Change feed (/api/v1/changes/)
+
+CHANGES_PAGE_SIZE = 500
+# Long-poll cap, kept below the gunicorn timeout
+CHANGES_MAX_WAIT = 25
+CHANGES_POLL_INTERVAL = 0.5
+# Long-polls allowed to wait at once per worker process; keep below GUNICORN_THREADS
+CHANGES_MAX_WAITERS = env.int('CHANGES_MAX_WAITERS', default=2)
+CHANGES_RETRY_AFTER = 2
+CHANGES_RETENTION_DAYS = env.int('CHANGES_RETENTION_DAYS', default=30)
@@ -0,0 +1,37 @@
+import gc
+import os
+
+from config import boot
+
+bind = '0.0.0.0:8000'
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+# Long-polls of /api/v1/changes/ wait in these threads; CHANGES_MAX_WAITERS
+# caps how many of them may do so at once.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 30
+
+# Load Django once in the master so workers share it copy-on-write.
+preload_app = True
+
+
+def on_starting(server):
+    boot.warm_up()
+    # Move everything allocated so far out of the collector's reach so GC
+    # passes in the workers don't touch (and copy) the shared pages.
+    gc.freeze()
+
+
+def on_reload(server):
+    # HUP re-runs setup() and reloads the preloaded app, but not on_starting.
+    boot.warm_up()
+    gc.freeze()
+
+
+def when_ready(server):
+    for line in boot.report():
+        server.log.info('boot: %s', line)
+
+
+def post_worker_init(worker):
+    seconds = boot.warm_worker()
+    worker.log.info('boot: worker %s warmed in %.1f ms', worker.pid, seconds * 1000)
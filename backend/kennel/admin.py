@@ -1,10 +1,25 @@
 from django.contrib import admin
 
+from .forms import DogMediaAdminForm, LitterAdminForm
 from .models import Dog, DogSize, DogColor, DogMedia, Litter
 
 
+class DirectUploadAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        form.normalize_uploaded()
+
+
+class DogMediaAdmin(DirectUploadAdmin):
+    form = DogMediaAdminForm
+
+
+class LitterAdmin(DirectUploadAdmin):
+    form = LitterAdminForm
+
+
 admin.site.register(Dog)
 admin.site.register(DogSize)
 admin.site.register(DogColor)
-admin.site.register(DogMedia)
-admin.site.register(Litter)
+admin.site.register(DogMedia, DogMediaAdmin)
+admin.site.register(Litter, LitterAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class KennelConfig(AppConfig):
     name = 'kennel'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+
+import psycopg
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from .models import Change
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'kennel_changes'
+# Arbitrary application-wide key for pg_advisory_xact_lock.
+LOCK_KEY = 0x6b656e6e
+
+
+def append(change):
+    """Record ``change`` with the caller's transaction; its cursor comes later.
+
+    The row commits or rolls back together with the data it describes, but
+    without a cursor. ``assign_cursors()`` numbers it once the caller has
+    committed, in a short transaction of its own. That is the only place the
+    advisory lock is taken, so it serializes cursor allocation, not the
+    callers' transactions; admin requests and cascade deletes no longer
+    hold it until they finish.
+
+    The trade-off: a change reaches the feed slightly after its data has
+    committed, and if the process dies in between, it stays unnumbered
+    until the next change is recorded and numbers it along with its own.
+    """
+    alias = router.db_for_write(Change)
+    change.save(using=alias)
+    transaction.on_commit(assign_cursors, using=alias, robust=True)
+
+
+def assign_cursors():
+    """Give committed changes without a cursor the next cursors, in id order.
+
+    On Postgres the advisory lock is held until this transaction commits,
+    so readers never see cursor 11 before 10 has committed. The NOTIFY is
+    likewise delivered to listeners on commit.
+    """
+    alias = router.db_for_write(Change)
+    connection = connections[alias]
+    changes = Change.objects.using(alias)
+    with transaction.atomic(using=alias):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK_KEY])
+        pending = list(changes.filter(cursor__isnull=True).order_by('id').values_list('id', flat=True))
+        if not pending:
+            return
+        latest = changes.aggregate(latest=Max('cursor'))['latest'] or 0
+        changes.bulk_update(
+            [Change(id=pk, cursor=latest + position) for position, pk in enumerate(pending, 1)],
+            ['cursor'],
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(latest + len(pending))])
+
+
+class ChangeNotifier:
+    """Wakes long-polling requests when the feed grows.
+
+    On Postgres one background thread per process LISTENs for the NOTIFY
+    sent by ``assign_cursors()``, so waiting requests don't query the database at
+    all. Elsewhere waiters fall back to polling. At most
+    ``CHANGES_MAX_WAITERS`` requests per process may wait at once so
+    long-polls can't take every worker thread away from the rest of the API.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._latest = 0
+        self._listening = False
+        self._thread = None
+        self._waiters = 0
+
+    def _connect(self):
+        settings_dict = connections['default'].settings_dict
+        return psycopg.connect(
+            dbname=settings_dict['NAME'],
+            user=settings_dict['USER'],
+            password=settings_dict['PASSWORD'],
+            host=settings_dict['HOST'],
+            port=settings_dict['PORT'] or None,
+            autocommit=True,
+        )
+
+    def _listen(self):
+        while True:
+            try:
+                with self._connect() as connection:
+                    connection.execute(f'LISTEN {CHANNEL}')
+                    # Catch up on anything committed before LISTEN took effect.
+                    latest = connection.execute(
+                        f'SELECT coalesce(max(cursor), 0) FROM {Change._meta.db_table}'
+                    ).fetchone()[0]
+                    self._advance(latest, listening=True)
+                    while True:
+                        for notify in connection.notifies(timeout=60):
+                            self._advance(int(notify.payload))
+            except Exception:
+                logger.exception('Change feed listener failed, reconnecting')
+                self._advance(0, listening=False)
+                time.sleep(1)
+
+    def _advance(self, latest, listening=None):
+        with self._condition:
+            self._latest = max(self._latest, latest)
+            if listening is not None:
+                self._listening = listening
+            self._condition.notify_all()
+
+    def _ensure_listener(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='change-feed-listener', daemon=True)
+                self._thread.start()
+
+    def wait(self, since, timeout, fetch):
+        """Wait up to ``timeout`` seconds for changes after ``since``.
+
+        Returns ``fetch()`` once something may have arrived, the last
+        (empty) result on timeout, or ``None`` if too many requests are
+        already waiting.
+        """
+        with self._condition:
+            if self._waiters >= settings.CHANGES_MAX_WAITERS:
+                return None
+            self._waiters += 1
+        try:
+            use_listener = connections['default'].vendor == 'postgresql'
+            if use_listener:
+                self._ensure_listener()
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return fetch()
+                with self._condition:
+                    if use_listener and self._listening:
+                        self._condition.wait_for(lambda: self._latest > since or not self._listening, remaining)
+                        if self._latest <= since:
+                            continue
+                        # A notification that fetch() can't see yet
+                        # shouldn't turn into a busy loop.
+                        pause = settings.CHANGES_POLL_INTERVAL
+                    else:
+                        # No listener (other backends, or reconnecting): poll.
+                        pause = 0
+                        self._condition.wait(min(settings.CHANGES_POLL_INTERVAL, remaining))
+                changes = fetch()
+                if changes:
+                    return changes
+                time.sleep(min(pause, max(deadline - time.monotonic(), 0)))
+        finally:
+            with self._condition:
+                self._waiters -= 1
+
+
+notifier = ChangeNotifier()
@@ -0,0 +1,98 @@
+from django import forms
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .images import normalize_on_commit
+from .models import DogMedia, Litter
+from .storage import issued_name, supports_direct_upload
+
+
+class DirectUploadAdminForm(forms.ModelForm):
+    """Admin form whose file goes straight to object storage.
+
+    With a bucket configured, ``direct_upload.js`` sends the chosen file to
+    a presigned URL and puts the signed upload token into ``upload_token``,
+    so the file itself never passes through the application server. Without one
+    the form behaves like a plain model form.
+    """
+
+    upload_field = None
+    upload_target = None
+    size_field = None
+
+    upload_token = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.direct_upload = supports_direct_upload()
+        field = self.fields[self.upload_field]
+        self.upload_required = field.required
+        if self.direct_upload:
+            field.required = False
+            field.widget.attrs.update({
+                'data-direct-upload': self.upload_target,
+                'data-presign-url': reverse('direct-upload'),
+            })
+
+    @property
+    def media(self):
+        media = super().media
+        if self.direct_upload:
+            media += forms.Media(js=['kennel/admin/direct_upload.js'])
+        return media
+
+    def get_upload_dog(self, cleaned_data):
+        return None
+
+    def should_normalize(self):
+        return True
+
+    def normalize_uploaded(self):
+        # Direct uploads are committed files, which the model's save() leaves
+        # alone, so normalize them once the admin's transaction is committed.
+        if self.cleaned_data.get('upload_token') and self.should_normalize():
+            normalize_on_commit(self.instance, self.upload_field, self.size_field)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        token = cleaned_data.get('upload_token')
+        if token:
+            name = issued_name(token, self.upload_target, self.get_upload_dog(cleaned_data))
+            if name is None or not default_storage.exists(name):
+                self.add_error(self.upload_field, 'The uploaded file could not be found, please upload it again.')
+            else:
+                setattr(self.instance, self.upload_field, name)
+        elif (
+            self.direct_upload
+            and self.upload_required
+            and not cleaned_data.get(self.upload_field)
+            and not getattr(self.instance, self.upload_field)
+        ):
+            self.add_error(self.upload_field, forms.Field.default_error_messages['required'])
+        return cleaned_data
+
+
+class DogMediaAdminForm(DirectUploadAdminForm):
+    upload_field = 'file'
+    upload_target = 'dog_media'
+    size_field = 'original_size'
+
+    class Meta:
+        model = DogMedia
+        fields = '__all__'
+
+    def get_upload_dog(self, cleaned_data):
+        return cleaned_data.get('dog')
+
+    def should_normalize(self):
+        return self.instance.media_type == DogMedia.MediaType.IMAGE
+
+
+class LitterAdminForm(DirectUploadAdminForm):
+    upload_field = 'photo'
+    upload_target = 'litter_photo'
+    size_field = 'photo_original_size'
+
+    class Meta:
+        model = Litter
+        fields = '__all__'
@@ -0,0 +1,102 @@
+from functools import partial
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+def normalize_image(file):
+    """Upright, metadata-free copy of ``file`` capped at MEDIA_MAX_DIMENSION.
+
+    Returns ``(content, extension)``, or ``None`` if ``file`` isn't an image
+    Pillow can read. Images with transparency are kept as PNG, everything
+    else is re-encoded as JPEG at MEDIA_JPEG_QUALITY.
+    """
+    max_dimension = settings.MEDIA_MAX_DIMENSION
+    try:
+        with Image.open(file) as source:
+            # Lets the JPEG decoder downscale while decoding huge photos.
+            source.draft('RGB', (max_dimension, max_dimension))
+            image = ImageOps.exif_transpose(source)
+            icc_profile = source.info.get('icc_profile')
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    # Pillow writes some of the source's info (JPEG comments, ...) back out.
+    image.info = {key: value for key, value in image.info.items() if key == 'transparency'}
+    if has_alpha:
+        image.save(buffer, 'PNG', optimize=True, icc_profile=icc_profile)
+        extension = 'png'
+    else:
+        image.convert('RGB').save(
+            buffer, 'JPEG',
+            quality=settings.MEDIA_JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+            icc_profile=icc_profile,
+        )
+        extension = 'jpg'
+    return ContentFile(buffer.getvalue()), extension
+
+
+def _replace(field_file, file):
+    normalized = normalize_image(file)
+    if normalized is not None:
+        content, extension = normalized
+        field_file.save(f'{PurePosixPath(field_file.name).stem}.{extension}', content, save=False)
+
+
+def normalize_upload(field_file):
+    """Normalize a not yet committed upload in place; returns its original size."""
+    original_size = field_file.size
+    field_file.file.seek(0)
+    _replace(field_file, field_file.file)
+    return original_size
+
+
+def normalize_stored(instance, field_name, size_field):
+    """Normalize an already stored file of ``instance`` and save the instance.
+
+    The original is deleted only once the row pointing at the normalized
+    copy has been committed; if saving fails the copy is removed instead,
+    so the row never points at a file that no longer exists.
+    """
+    field_file = getattr(instance, field_name)
+    old_name = field_file.name
+    with field_file.open('rb'):
+        data = field_file.read()
+
+    _replace(field_file, BytesIO(data))
+    new_name = field_file.name
+    setattr(instance, size_field, len(data))
+    try:
+        with transaction.atomic():
+            instance.save(update_fields=[field_name, size_field])
+    except Exception:
+        if new_name != old_name:
+            field_file.storage.delete(new_name)
+        raise
+
+    if new_name != old_name:
+        transaction.on_commit(partial(field_file.storage.delete, old_name))
+
+
+def normalize_on_commit(instance, field_name, size_field):
+    """``normalize_stored()`` once the current transaction has committed.
+
+    Keeps the download, re-encode and upload out of the caller's
+    transaction. A failure is logged rather than raised, since the caller's
+    work is committed by then; the row keeps its original and
+    ``normalizemedia`` picks it up later.
+    """
+    def normalize():
+        normalize_stored(instance, field_name, size_field)
+
+    transaction.on_commit(normalize, robust=True)
@@ -0,0 +1,62 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from rest_framework.renderers import JSONRenderer
+
+from kennel.middleware import brotli
+from kennel.models import Dog, Litter
+from kennel.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Report rendered/compressed payload size and render time per API endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def get_endpoints(self):
+        endpoints = [
+            '/api/v1/puppies/?page_size=100',
+            '/api/v1/producers/?page_size=100',
+            '/api/v1/graduates/?page_size=100',
+            '/api/v1/litters/',
+            '/api/v1/producers/kinship/',
+        ]
+        dog = Dog.objects.order_by('id').first()
+        if dog:
+            endpoints.append(f'/api/v1/dogs/{dog.slug}/')
+        litter = Litter.objects.order_by('id').first()
+        if litter:
+            endpoints.append(f'/api/v1/litters/{litter.slug}/')
+        return endpoints
+
+    def time_render(self, renderer, data, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            content = renderer.render(data)
+        return content, (time.perf_counter() - start) / iterations * 1000
+
+    def handle(self, *args, **options):
+        client = Client()
+        iterations = options['iterations']
+
+        self.stdout.write(
+            f'{"endpoint":<42} {"json ms":>8} {"orjson ms":>9} {"raw B":>9} {"gzip B":>8} {"br B":>8}'
+        )
+        for url in self.get_endpoints():
+            response = client.get(url, HTTP_HOST='localhost')
+            if response.status_code != 200:
+                self.stdout.write(f'{url:<42} HTTP {response.status_code}')
+                continue
+
+            content, json_ms = self.time_render(JSONRenderer(), response.data, iterations)
+            _, orjson_ms = self.time_render(ORJSONRenderer(), response.data, iterations)
+            gzip_size = len(gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0))
+            br_size = len(brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)) if brotli else '-'
+
+            self.stdout.write(
+                f'{url:<42} {json_ms:>8.2f} {orjson_ms:>9.2f} {len(content):>9} {gzip_size:>8} {br_size:>8}'
+            )
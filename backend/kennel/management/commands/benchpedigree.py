@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from kennel.pedigree import PedigreeGraph
+
+
+class SyntheticGraph(PedigreeGraph):
+    def ensure_loaded(self, *args, **kwargs):
+        # Built in memory; there's nothing to load from the database.
+        pass
+
+
+def synthetic_graph(generations=12, per_generation=408, seed=0):
+    """Random pedigree built in memory, without touching the database.
+
+    Each dog's parents come from the previous two generations, so lines
+    cross and the kinship pass has plenty of shared ancestry to work on.
+    """
+    rng = random.Random(seed)
+    graph = SyntheticGraph()
+    previous, current = [], []
+    for _ in range(generations):
+        previous, current = previous + current, []
+        pool = previous[-2 * per_generation:]
+        for _ in range(per_generation):
+            dog_id = len(graph.dog_ids) + 1
+            graph._add(dog_id)
+            i = graph.index[dog_id]
+            if pool:
+                graph.sires[i] = rng.choice(pool[::2])
+                graph.dams[i] = rng.choice(pool[1::2])
+            current.append(i)
+    graph._compute_generations()
+    return graph
+
+
+class Command(BaseCommand):
+    help = 'Time the producer kinship matrix on a synthetic pedigree.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generations', type=int, default=12)
+        parser.add_argument('--per-generation', type=int, default=408)
+        parser.add_argument('--producers', type=int, nargs='+', default=[200, 500, 1000])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        graph = synthetic_graph(options['generations'], options['per_generation'], options['seed'])
+        rng = random.Random(options['seed'])
+        self.stdout.write(f'{len(graph.dog_ids)} dogs in {options["generations"]} generations')
+
+        for count in options['producers']:
+            producers = rng.sample(list(graph.dog_ids), min(count, len(graph.dog_ids)))
+            start = time.perf_counter()
+            graph.kinship_matrix(producers)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{len(producers):>6} producers: {elapsed * 1000:8.1f} ms')
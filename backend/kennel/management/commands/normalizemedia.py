@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from kennel.images import normalize_stored
+from kennel.models import DogMedia, Litter
+
+
+def normalize(model, pk, field_name, size_field):
+    try:
+        instance = model.objects.get(pk=pk)
+        normalize_stored(instance, field_name, size_field)
+        return instance
+    finally:
+        # Each worker thread has its own connection.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Normalize stored original images that predate upload-time normalization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def get_jobs(self):
+        media = (
+            DogMedia.objects
+            .filter(media_type=DogMedia.MediaType.IMAGE, original_size__isnull=True)
+            .exclude(file='')
+            .values_list('pk', flat=True)
+        )
+        litters = (
+            Litter.objects
+            .filter(photo_original_size__isnull=True)
+            .exclude(photo__isnull=True)
+            .exclude(photo='')
+            .values_list('pk', flat=True)
+        )
+        return (
+            [(DogMedia, pk, 'file', 'original_size') for pk in media]
+            + [(Litter, pk, 'photo', 'photo_original_size') for pk in litters]
+        )
+
+    def handle(self, *args, **options):
+        jobs = self.get_jobs()
+        self.stdout.write(f'Normalizing {len(jobs)} images with {options["workers"]} workers')
+
+        failed = 0
+        # Pillow releases the GIL while decoding, resizing and encoding.
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(normalize, *job): job for job in jobs}
+            for future in as_completed(futures):
+                model, pk = futures[future][:2]
+                try:
+                    future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} {pk}: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(jobs) - failed} normalized, {failed} failed'))
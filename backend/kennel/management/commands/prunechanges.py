@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from kennel.models import Change
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than the retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGES_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        # Always keep the newest entry so cursors can still be validated, and
+        # entries still waiting for a cursor so their events aren't lost.
+        latest = Change.objects.aggregate(latest=Max('cursor'))['latest']
+        deleted, _ = (
+            Change.objects
+            .filter(created_at__lt=cutoff, cursor__isnull=False)
+            .exclude(cursor=latest)
+            .delete()
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} changes'))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kennel.routers import REPLICA, replica_lag
+
+
+class Command(BaseCommand):
+    help = 'Print how many seconds the read replica is behind the primary.'
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError('No replica database is configured (POSTGRES_REPLICA_HOST).')
+
+        lag = replica_lag()
+        style = self.style.SUCCESS if lag <= settings.REPLICA_MAX_LAG else self.style.WARNING
+        self.stdout.write(style(f'{lag:.3f}'))
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .routers import pinned_to_primary, wrote_to_primary
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts = re.compile(r'\s*([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def parse_accept_encoding(header):
+    accepted = {}
+    for part in header.lower().split(','):
+        match = re_accepts.fullmatch(part)
+        if not match:
+            continue
+        try:
+            quality = float(match[2]) if match[2] else 1.0
+        except ValueError:
+            continue
+        accepted[match[1]] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """Negotiated Brotli/gzip compression of API responses.
+
+    Only content types listed in ``COMPRESSION_CONTENT_TYPES`` and bodies of
+    at least ``COMPRESSION_MIN_SIZE`` bytes are compressed; HTML is left out
+    on purpose so CSRF-bearing admin pages aren't exposed to BREACH.
+    Compressed bodies are kept in a small LRU keyed by the body digest, so
+    repeated identical payloads are only compressed once per worker.
+    """
+
+    encodings = ('br', 'gzip')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        self.content_types = tuple(settings.COMPRESSION_CONTENT_TYPES)
+        self.cache_size = settings.COMPRESSION_CACHE_SIZE
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def choose_encoding(self, request):
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding', ''))
+        available = [e for e in self.encodings if e != 'br' or brotli is not None]
+        candidates = [e for e in available if accepted.get(e, accepted.get('*', 0)) > 0]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda e: accepted.get(e, accepted.get('*', 0)))
+
+    def compress(self, encoding, content):
+        if encoding == 'br':
+            return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+    def cached_compress(self, encoding, content):
+        if not self.cache_size:
+            return self.compress(encoding, content)
+
+        key = (encoding, hashlib.blake2b(content, digest_size=16).digest())
+        with self.lock:
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                self.cache.move_to_end(key)
+                return compressed
+
+        compressed = self.compress(encoding, content)
+        with self.lock:
+            self.cache[key] = compressed
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return compressed
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in self.content_types:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if len(response.content) < self.min_size:
+            return response
+
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        compressed = self.cached_compress(encoding, response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Read-your-writes for replica routing.
+
+    A request that writes sets a short-lived signed cookie; while its
+    signature is younger than ``REPLICA_STICKY_SECONDS`` the client's reads
+    stay on the primary. The age comes from the signature timestamp, so a
+    client can't pin itself to the primary for longer than that.
+    """
+
+    cookie_name = 'primary_pin'
+    cookie_salt = 'kennel.replica-stickiness'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_pinned(self, request):
+        return request.get_signed_cookie(
+            self.cookie_name,
+            default=None,
+            salt=self.cookie_salt,
+            max_age=settings.REPLICA_STICKY_SECONDS,
+        ) is not None
+
+    def __call__(self, request):
+        pinned_token = pinned_to_primary.set(self.is_pinned(request))
+        wrote_token = wrote_to_primary.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = wrote_to_primary.get()
+        finally:
+            pinned_to_primary.reset(pinned_token)
+            wrote_to_primary.reset(wrote_token)
+
+        if wrote:
+            response.set_signed_cookie(
+                self.cookie_name,
+                '1',
+                salt=self.cookie_salt,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=True,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
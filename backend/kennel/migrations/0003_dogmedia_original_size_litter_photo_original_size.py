@@ -0,0 +1,23 @@
+# Generated by Django 6.0.5 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kennel', '0002_delete_littermedia_litter_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dogmedia',
+            name='original_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='litter',
+            name='photo_original_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.5 on 2026-10-19 19:10
+
+from django.db import migrations, models
+
+
+def number_existing_changes(apps, schema_editor):
+    Change = apps.get_model('kennel', 'Change')
+    Change.objects.update(cursor=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kennel', '0004_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='cursor',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(condition=models.Q(('cursor__isnull', True)), fields=['id'], name='kennel_change_pending'),
+        ),
+    ]
@@ -4,6 +4,8 @@ from slugify import slugify
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFit, Transpose
 
+from .images import normalize_upload
+
 
 def dog_media_upload_to(instance, filename):
     dog = instance.dog
@@ -85,6 +87,7 @@ class DogMedia(models.Model):
     media_type = models.CharField(max_length=10, choices=MediaType, default='image')
     is_cover = models.BooleanField('Обложка', default=False)
     order = models.PositiveIntegerField('Порядок', default=0)
+    original_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
 
     thumb = ImageSpecField(
         source='file',
@@ -125,6 +128,8 @@ class DogMedia(models.Model):
         return f"Медиа для {self.dog.name} ({self.media_type})"
 
     def save(self, *args, **kwargs):
+        if self.media_type == self.MediaType.IMAGE and self.file and not self.file._committed:
+            self.original_size = normalize_upload(self.file)
         if self.is_cover:
             DogMedia.objects.filter(dog=self.dog, is_cover=True).exclude(pk=self.pk).update(is_cover=False)
         super().save(*args, **kwargs)
@@ -135,6 +140,7 @@ class Litter(models.Model):
     birth_date = models.DateField()
     description = models.TextField(blank=True)
     photo = models.ImageField(upload_to='litters/', blank=True, null=True)
+    photo_original_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
 
     medium = ImageSpecField(
         source='photo',
@@ -152,6 +158,35 @@ class Litter(models.Model):
     )
 
 
+    def save(self, *args, **kwargs):
+        if self.photo and not self.photo._committed:
+            self.photo_original_size = normalize_upload(self.photo)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'Помёт {self.mother.name} x {self.father.name} ({self.birth_date})'
 
+
+
+class Change(models.Model):
+    class Operation(models.TextChoices):
+        UPSERT = "upsert", "Upsert"
+        DELETE = "delete", "Delete"
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    slug = models.CharField(max_length=255, blank=True)
+    operation = models.CharField(max_length=10, choices=Operation.choices)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Position in the feed, assigned in commit order by kennel.feed; NULL
+    # until then.
+    cursor = models.BigIntegerField(null=True, unique=True, editable=False)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(cursor__isnull=True), name='kennel_change_pending'),
+        ]
+
+    def __str__(self):
+        return f'{self.operation} {self.model} {self.object_id}'
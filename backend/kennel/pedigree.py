@@ -0,0 +1,278 @@
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Change, Dog, Litter
+
+NO_PARENT = -1
+
+
+class PedigreeGraph:
+    """Array-backed lineage of the whole kennel.
+
+    Dogs are addressed by a dense index; ``sires``/``dams`` hold parent
+    indexes (or ``NO_PARENT``) and ``generations`` keeps every dog strictly
+    deeper than its parents, which is the order the kinship pass visits
+    them in.
+    The graph is loaded lazily and patched in place by the model signals.
+    Other worker processes don't get those signals, so every use checks the
+    newest dog/litter cursor of the change feed and reloads when it moved or
+    when a requested dog is missing; ``PEDIGREE_GRAPH_TTL`` is a backstop
+    for writes that bypass the signals altogether.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self.index = {}
+        self.dog_ids = array('q')
+        self.sires = array('l')
+        self.dams = array('l')
+        self.generations = array('l')
+        self.dog_litter = {}
+        self.litters = {}
+
+    # Loading and incremental updates
+
+    @staticmethod
+    def current_version():
+        return (
+            Change.objects
+            .filter(model__in=[Dog._meta.model_name, Litter._meta.model_name])
+            .aggregate(version=Max('cursor'))['version']
+        )
+
+    def load(self, version=None):
+        # The version is read before the data, so a change committed in
+        # between makes the next check reload again rather than be missed.
+        if version is None:
+            version = self.current_version()
+        with self._lock:
+            self._reset()
+            self.litters = {
+                pk: (mother_id, father_id)
+                for pk, mother_id, father_id in Litter.objects.values_list('id', 'mother_id', 'father_id')
+            }
+            for pk, litter_id in Dog.objects.values_list('id', 'litter_id').order_by('id'):
+                self._add(pk)
+                self.dog_litter[pk] = litter_id
+            for pk in self.dog_ids:
+                self._link(pk)
+            self._compute_generations()
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, dog_ids=()):
+        version = self.current_version()
+        with self._lock:
+            if (
+                self._loaded_at is None
+                or time.monotonic() - self._loaded_at > settings.PEDIGREE_GRAPH_TTL
+                or version != self._version
+                or any(pk not in self.index for pk in dog_ids)
+            ):
+                self.load(version)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _add(self, dog_id):
+        self.index[dog_id] = len(self.dog_ids)
+        self.dog_ids.append(dog_id)
+        self.sires.append(NO_PARENT)
+        self.dams.append(NO_PARENT)
+        self.generations.append(0)
+
+    def _link(self, dog_id):
+        i = self.index[dog_id]
+        mother_id, father_id = self.litters.get(self.dog_litter.get(dog_id), (None, None))
+        self.dams[i] = self.index.get(mother_id, NO_PARENT)
+        self.sires[i] = self.index.get(father_id, NO_PARENT)
+
+    def _compute_generations(self):
+        # Iterative DFS so that deep pedigrees don't hit the recursion limit.
+        # A parent still being visited is on the current path, i.e. a cycle
+        # in bad data; that edge is cut by treating the parent as unknown.
+        visiting, done = 1, 2
+        state = bytearray(len(self.dog_ids))
+        for root in range(len(self.dog_ids)):
+            if state[root]:
+                continue
+            state[root] = visiting
+            stack = [(root, iter((self.sires, self.dams)))]
+            while stack:
+                i, parent_arrays = stack[-1]
+                for parents in parent_arrays:
+                    p = parents[i]
+                    if p == NO_PARENT:
+                        continue
+                    if state[p] == visiting:
+                        parents[i] = NO_PARENT
+                    elif not state[p]:
+                        state[p] = visiting
+                        stack.append((p, iter((self.sires, self.dams))))
+                        break
+                else:
+                    stack.pop()
+                    generations = [self.generations[p] for p in (self.sires[i], self.dams[i]) if p != NO_PARENT]
+                    self.generations[i] = max(generations) + 1 if generations else 0
+                    state[i] = done
+
+    def update_dog(self, dog_id, litter_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if dog_id in self.index and self.dog_litter.get(dog_id) == litter_id:
+                # Name, description, status... don't change the lineage.
+                return
+            if dog_id not in self.index:
+                self._add(dog_id)
+            self.dog_litter[dog_id] = litter_id
+            self._link(dog_id)
+            self._compute_generations()
+
+    def remove_dog(self, dog_id):
+        # Indexes are dense, so removing a node means a reload.
+        self.invalidate()
+
+    def update_litter(self, litter_id, mother_id, father_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if self.litters.get(litter_id, (None, None)) == (mother_id, father_id):
+                return
+            if mother_id is None and father_id is None:
+                self.litters.pop(litter_id, None)
+            else:
+                self.litters[litter_id] = (mother_id, father_id)
+            for dog_id, dog_litter_id in self.dog_litter.items():
+                if dog_litter_id == litter_id:
+                    if mother_id is None and father_id is None:
+                        self.dog_litter[dog_id] = None
+                    self._link(dog_id)
+            self._compute_generations()
+
+    # Wright's coefficients
+
+    def _snapshot(self, dog_ids):
+        """Graph indexes of ``dog_ids`` and a copy of the lineage arrays, so
+        the kinship pass can run without holding the lock."""
+        self.ensure_loaded(dog_ids)
+        with self._lock:
+            nodes = [self.index.get(pk, NO_PARENT) for pk in dog_ids]
+            return nodes, array('l', self.sires), array('l', self.dams), self.generations.tolist()
+
+    @staticmethod
+    def _kinship_rows(nodes, sires, dams, generations):
+        """Kinship between every pair of ``nodes`` (graph indexes).
+
+        The requested dogs and their ancestors are visited parents first,
+        keeping a kinship row for each dog that is still needed: one that is
+        requested, or has a child that hasn't been visited yet. A new dog's
+        row is the mean of its parents' rows, since it can't be an ancestor
+        of anyone visited before it. Ancestors are dropped as soon as their
+        last child is visited, so memory is bounded by the widest generation
+        plus the requested dogs rather than by every pair of the pedigree.
+        """
+        requested = {i for i in nodes if i != NO_PARENT}
+        needed = set()
+        stack = list(requested)
+        while stack:
+            i = stack.pop()
+            if i not in needed:
+                needed.add(i)
+                stack.extend(p for p in (sires[i], dams[i]) if p != NO_PARENT and p not in needed)
+        order = sorted(needed, key=generations.__getitem__)
+
+        children = dict.fromkeys(order, 0)
+        for i in order:
+            for p in (sires[i], dams[i]):
+                if p != NO_PARENT:
+                    children[p] += 1
+
+        # Rows are indexed by slot and a dropped dog's slot is reused, so
+        # every row only needs room for the most dogs kept at any one time.
+        remaining = dict(children)
+        kept = width = 0
+        for i in order:
+            kept += 1
+            width = max(width, kept)
+            for p in (sires[i], dams[i]):
+                if p != NO_PARENT:
+                    remaining[p] -= 1
+                    if not remaining[p] and p not in requested:
+                        kept -= 1
+
+        # One flat width x width matrix, symmetric, so a dog's row and
+        # column are both a single slice assignment. Only the first ``used``
+        # slots have ever held a dog, so rows are computed up to there.
+        matrix = array('d', bytes(8 * width * width))
+        slots = {}
+        free = list(range(width - 1, -1, -1))
+        used = 0
+        for i in order:
+            slot = free.pop()
+            used = max(used, slot + 1)
+            s, d = sires[i], dams[i]
+            if s != NO_PARENT and d != NO_PARENT:
+                row_s = matrix[slots[s] * width:slots[s] * width + used]
+                row_d = matrix[slots[d] * width:slots[d] * width + used]
+                row = array('d', [0.5 * (x + y) for x, y in zip(row_s, row_d)])
+                row[slot] = 0.5 * (1.0 + row_s[slots[d]])
+            elif s != NO_PARENT or d != NO_PARENT:
+                p = slots[s if s != NO_PARENT else d] * width
+                row = array('d', [0.5 * x for x in matrix[p:p + used]])
+                row[slot] = 0.5
+            else:
+                row = array('d', bytes(8 * used))
+                row[slot] = 0.5
+            matrix[slot * width:slot * width + used] = row
+            matrix[slot:slot + used * width:width] = row
+            slots[i] = slot
+
+            for p in (s, d):
+                if p != NO_PARENT:
+                    children[p] -= 1
+                    if not children[p] and p not in requested:
+                        free.append(slots.pop(p))
+
+        # Unknown dogs read from an extra, always zero, column and count as
+        # dogs without known parents themselves.
+        columns = [slots.get(i, width) for i in nodes]
+        result = []
+        for position, i in enumerate(nodes):
+            if i == NO_PARENT:
+                result.append([0.0] * len(nodes))
+                result[-1][position] = 0.5
+                continue
+            row = matrix[slots[i] * width:(slots[i] + 1) * width]
+            row.append(0.0)
+            result.append([row[c] for c in columns])
+        return result
+
+    def kinship(self, dog_a, dog_b):
+        return self.kinship_matrix([dog_a, dog_b])[0][1]
+
+    def inbreeding(self, dog_id):
+        nodes, sires, dams, generations = self._snapshot([dog_id])
+        i = nodes[0]
+        if i == NO_PARENT:
+            return 0.0
+        return self._kinship_rows([sires[i], dams[i]], sires, dams, generations)[0][1]
+
+    def kinship_matrix(self, dog_ids):
+        """Kinship between every pair of ``dog_ids``; this is also the COI
+        of a puppy from that pairing, and ``2 * matrix[i][i] - 1`` is the
+        COI of the dog itself."""
+        return self._kinship_rows(*self._snapshot(dog_ids))
+
+
+graph = PedigreeGraph()
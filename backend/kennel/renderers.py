@@ -0,0 +1,29 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson.
+
+    Types orjson doesn't know natively (Decimal, lazy translations, ...)
+    and datetimes, which DRF writes with a ``Z`` for UTC, go through DRF's
+    own encoder. Indented output, as requested by the browsable API, and
+    anything orjson can't encode at all (integers beyond 64 bits) are left
+    to the stdlib renderer.
+    """
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,81 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+
+replica_reads_enabled = ContextVar('replica_reads_enabled', default=False)
+pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+wrote_to_primary = ContextVar('wrote_to_primary', default=False)
+
+_lag = {'checked_at': None, 'seconds': None}
+
+
+def replica_lag(alias=REPLICA):
+    """Seconds the replica is behind the primary; 0 when fully replayed."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+        )
+        return float(cursor.fetchone()[0] or 0)
+
+
+def replica_usable():
+    now = time.monotonic()
+    if _lag['checked_at'] is None or now - _lag['checked_at'] > settings.REPLICA_LAG_CHECK_INTERVAL:
+        _lag['checked_at'] = now
+        try:
+            _lag['seconds'] = replica_lag()
+        except DatabaseError:
+            logger.warning('Replica is unreachable, reading from primary')
+            _lag['seconds'] = None
+        else:
+            if _lag['seconds'] > settings.REPLICA_MAX_LAG:
+                logger.warning('Replica is %.1fs behind, reading from primary', _lag['seconds'])
+    return _lag['seconds'] is not None and _lag['seconds'] <= settings.REPLICA_MAX_LAG
+
+
+@contextmanager
+def replica_reads():
+    token = replica_reads_enabled.set(True)
+    try:
+        yield
+    finally:
+        replica_reads_enabled.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Sends reads to the replica only inside ``replica_reads()``.
+
+    Anything outside it (admin, management commands, writes) stays on
+    ``default``, as does everything once the current request has written
+    or while the client is pinned to the primary after a recent write.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            REPLICA in settings.DATABASES
+            and replica_reads_enabled.get()
+            and not pinned_to_primary.get()
+            and not wrote_to_primary.get()
+            and replica_usable()
+        ):
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        wrote_to_primary.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
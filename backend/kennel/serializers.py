@@ -1,4 +1,5 @@
-from .models import Dog, DogColor, DogSize, DogMedia, Litter
+from .models import Change, Dog, DogColor, DogSize, DogMedia, Litter
+from .storage import issued_name
 from rest_framework import serializers
 
 
@@ -189,7 +190,8 @@ class DogDetailSerializer(serializers.ModelSerializer):
     media = DogMediaSerializer(many=True, read_only=True)
 
     def get_cover(self, obj):
-        cover_media = obj.media.filter(is_cover=True).first()
+        # Filter in Python so prefetched media don't cost a query per dog.
+        cover_media = next((media for media in obj.media.all() if media.is_cover), None)
         if cover_media:
             return DogMediaSerializer(cover_media, context=self.context).data
         return None
@@ -213,4 +215,44 @@ class DogDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'slug', 'name', 'description', 'cover', 'birth_date',
             'gender', 'status', 'role', 'size', 'color', 'litter', 'media'
-        ]
\ No newline at end of file
+        ]
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    target = serializers.ChoiceField(choices=['dog_media', 'litter_photo'])
+    dog = serializers.PrimaryKeyRelatedField(queryset=Dog.objects.all(), required=False)
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False)
+    media_type = serializers.ChoiceField(choices=DogMedia.MediaType.choices, default=DogMedia.MediaType.IMAGE)
+
+    def validate(self, attrs):
+        if attrs['target'] == 'dog_media' and not attrs.get('dog'):
+            raise serializers.ValidationError({'dog': 'Dog media needs a dog.'})
+        return attrs
+
+
+class DirectUploadCompleteSerializer(serializers.Serializer):
+    dog = serializers.PrimaryKeyRelatedField(queryset=Dog.objects.all(), required=False)
+    litter = serializers.PrimaryKeyRelatedField(queryset=Litter.objects.all(), required=False)
+    token = serializers.CharField()
+    media_type = serializers.ChoiceField(choices=DogMedia.MediaType.choices, default=DogMedia.MediaType.IMAGE)
+    is_cover = serializers.BooleanField(default=False)
+    order = serializers.IntegerField(min_value=0, default=0)
+
+    def validate(self, attrs):
+        if bool(attrs.get('dog')) == bool(attrs.get('litter')):
+            raise serializers.ValidationError('Specify either a dog or a litter.')
+        target = 'dog_media' if attrs.get('dog') else 'litter_photo'
+        attrs['name'] = issued_name(attrs['token'], target, attrs.get('dog'))
+        if attrs['name'] is None:
+            raise serializers.ValidationError({'token': 'Upload token is invalid or has expired.'})
+        return attrs
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    op = serializers.CharField(source='operation')
+    id = serializers.IntegerField(source='object_id')
+
+    class Meta:
+        model = Change
+        fields = ['cursor', 'op', 'model', 'id', 'slug']
@@ -0,0 +1,67 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import feed
+from .models import Change, Dog, DogMedia, Litter
+from .pedigree import graph
+
+
+# The pedigree graph is patched only once the change is committed, so a
+# rolled back save can't leave it out of step with the database.
+
+@receiver(post_save, sender=Dog)
+def update_pedigree_dog(sender, instance, **kwargs):
+    transaction.on_commit(partial(graph.update_dog, instance.pk, instance.litter_id))
+
+
+@receiver(post_delete, sender=Dog)
+def remove_pedigree_dog(sender, instance, **kwargs):
+    transaction.on_commit(partial(graph.remove_dog, instance.pk))
+
+
+@receiver(post_save, sender=Litter)
+def update_pedigree_litter(sender, instance, **kwargs):
+    transaction.on_commit(partial(graph.update_litter, instance.pk, instance.mother_id, instance.father_id))
+
+
+@receiver(post_delete, sender=Litter)
+def remove_pedigree_litter(sender, instance, **kwargs):
+    transaction.on_commit(partial(graph.update_litter, instance.pk, None, None))
+
+
+# Change feed
+
+def change_slug(instance):
+    if isinstance(instance, DogMedia):
+        # Media changes are reported against the dog they belong to.
+        dog = Dog.objects.filter(pk=instance.dog_id).values_list('slug', flat=True).first()
+        return dog or ''
+    return instance.slug
+
+
+def record_change(instance, operation):
+    change = Change(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        slug=change_slug(instance),
+        operation=operation,
+    )
+    feed.append(change)
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_save, sender=DogMedia)
+@receiver(post_save, sender=Litter)
+def record_upsert(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(instance, Change.Operation.UPSERT)
+
+
+@receiver(post_delete, sender=Dog)
+@receiver(post_delete, sender=DogMedia)
+@receiver(post_delete, sender=Litter)
+def record_delete(sender, instance, **kwargs):
+    record_change(instance, Change.Operation.DELETE)
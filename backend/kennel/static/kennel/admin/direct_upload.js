@@ -0,0 +1,91 @@
+'use strict';
+{
+    // Uploads files picked in inputs marked with data-direct-upload straight
+    // to object storage via a presigned POST, then submits only the signed
+    // upload token (in the form's hidden upload_token field) to the admin.
+
+    function fieldValue(form, name) {
+        const field = form.querySelector(`[name="${name}"]`);
+        return field ? field.value : '';
+    }
+
+    async function presign(input, file) {
+        const form = input.form;
+        const body = {target: input.dataset.directUpload, filename: file.name};
+        if (file.type) {
+            body.content_type = file.type;
+        }
+        if (body.target === 'dog_media') {
+            body.dog = fieldValue(form, 'dog');
+            body.media_type = fieldValue(form, 'media_type') || 'image';
+            if (!body.dog) {
+                throw new Error('choose a dog first');
+            }
+        }
+        const response = await fetch(input.dataset.presignUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': fieldValue(form, 'csrfmiddlewaretoken'),
+            },
+            body: JSON.stringify(body),
+        });
+        if (!response.ok) {
+            throw new Error(await response.text());
+        }
+        return response.json();
+    }
+
+    async function upload(input) {
+        const file = input.files[0];
+        const presigned = await presign(input, file);
+        const data = new FormData();
+        for (const [key, value] of Object.entries(presigned.fields)) {
+            data.append(key, value);
+        }
+        data.append('file', file);
+        const response = await fetch(presigned.url, {method: 'POST', body: data});
+        if (!response.ok) {
+            throw new Error(`storage responded ${response.status}`);
+        }
+        input.form.querySelector('[name="upload_token"]').value = presigned.token;
+        // The file is stored already; don't send it through the app again.
+        input.value = '';
+        return presigned.name;
+    }
+
+    function setSubmitting(form, busy) {
+        form.querySelectorAll('[type="submit"]').forEach((button) => {
+            button.disabled = busy;
+        });
+    }
+
+    function init(input) {
+        const status = document.createElement('span');
+        status.className = 'help';
+        input.after(status);
+
+        input.addEventListener('change', () => {
+            if (!input.files.length) {
+                return;
+            }
+            input.form.querySelector('[name="upload_token"]').value = '';
+            status.textContent = 'Uploading…';
+            setSubmitting(input.form, true);
+            upload(input).then(
+                (name) => {
+                    status.textContent = `Uploaded: ${name}`;
+                },
+                (error) => {
+                    status.textContent = `Upload failed: ${error.message}`;
+                    input.value = '';
+                },
+            ).finally(() => setSubmitting(input.form, false));
+        });
+    }
+
+    window.addEventListener('load', () => {
+        document.querySelectorAll('input[type="file"][data-direct-upload]').forEach(init);
+    });
+}
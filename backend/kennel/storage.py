@@ -0,0 +1,78 @@
+import posixpath
+from functools import cache
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+
+UPLOAD_TOKEN_SALT = 'kennel.direct-upload'
+
+
+def supports_direct_upload():
+    return bool(getattr(settings, 'AWS_STORAGE_BUCKET_NAME', ''))
+
+
+@cache
+def presign_client():
+    # Imported here so boto3/botocore only load once a bucket is in use.
+    import boto3
+
+    # Presigned URLs embed the endpoint, so they're signed against the one
+    # browsers can reach rather than the in-cluster one the storage uses.
+    endpoint_url = settings.AWS_S3_PUBLIC_ENDPOINT_URL or settings.AWS_S3_ENDPOINT_URL
+    return boto3.session.Session().client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=default_storage.access_key,
+        aws_secret_access_key=default_storage.secret_key,
+        region_name=default_storage.region_name,
+        config=default_storage.client_config,
+    )
+
+
+def issue_upload_token(name, target, dog=None):
+    """Signed proof that ``name`` was reserved for this upload target."""
+    return signing.dumps({'name': name, 'target': target, 'dog': dog.pk if dog else None}, salt=UPLOAD_TOKEN_SALT)
+
+
+def issued_name(token, target, dog=None):
+    """Name ``token`` was issued for, or ``None`` if it is forged, has
+    expired or was issued for another target or dog."""
+    try:
+        data = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=settings.DIRECT_UPLOAD_EXPIRES)
+    except signing.BadSignature:
+        return None
+    if data.get('target') != target or data.get('dog') != (dog.pk if dog else None):
+        return None
+    return data.get('name')
+
+
+def reserve_name(field, instance, filename):
+    """Storage name for a direct upload of ``filename`` to ``field``.
+
+    A presigned POST overwrites whatever is stored under its key and
+    ``get_available_name`` reserves nothing, so the stem gets a random
+    suffix instead; the original stem is shortened to fit ``max_length``.
+    """
+    directory, basename = posixpath.split(field.generate_filename(instance, filename))
+    stem, extension = posixpath.splitext(basename)
+    suffix = f'_{uuid4().hex}{extension}'
+    room = field.max_length - len(posixpath.join(directory, suffix))
+    return posixpath.join(directory, stem[:max(room, 0)] + suffix)
+
+
+def presign_upload(name, content_type=None):
+    key = posixpath.join(default_storage.location, name) if default_storage.location else name
+    fields = {}
+    conditions = [['content-length-range', 1, settings.DIRECT_UPLOAD_MAX_SIZE]]
+    if content_type:
+        fields['Content-Type'] = content_type
+        conditions.append({'Content-Type': content_type})
+    return presign_client().generate_presigned_post(
+        Bucket=default_storage.bucket_name,
+        Key=key,
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=settings.DIRECT_UPLOAD_EXPIRES,
+    )
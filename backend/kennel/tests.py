@@ -1,3 +1,830 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import urllib3
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from .management.commands.benchpedigree import synthetic_graph
+from .images import normalize_image, normalize_on_commit
+from .middleware import CompressionMiddleware, ReplicaStickinessMiddleware, brotli
+from .models import Change, Dog, DogColor, DogMedia, DogSize, Litter
+from .pedigree import NO_PARENT, PedigreeGraph, graph
+from .renderers import ORJSONRenderer
+from . import routers
+from .routers import PrimaryReplicaRouter, pinned_to_primary, replica_reads, wrote_to_primary
+from .storage import issue_upload_token, issued_name, presign_client, reserve_name
+
+
+class ORJSONRendererTests(TestCase):
+    def test_output_matches_drf_renderer(self):
+        data = {
+            'results': [{
+                'slug': 'rex',
+                'name': 'Рекс',
+                'weight': Decimal('12.50'),
+                'gender': {'value': 'male', 'label': gettext_lazy('Boy')},
+                'birth_date': date(2020, 1, 1),
+                'created_at': datetime(2020, 1, 1, 12, 30, tzinfo=timezone.utc),
+                'uuid': uuid.UUID(int=1),
+                'cover': None,
+            }],
+            'coi': [[0.5, 0.125], [0.125, 0.5]],
+            1: 'non-str key',
+            'big': 2 ** 70,
+        }
+        for item in data, data['results'][0], []:
+            self.assertEqual(ORJSONRenderer().render(item), JSONRenderer().render(item))
+
+    def test_indented_output_uses_stdlib_renderer(self):
+        data = {'slug': 'rex', 'weight': Decimal('12.5')}
+        for media_type, context in (('application/json; indent=2', {}), ('application/json', {'indent': 2})):
+            self.assertEqual(
+                ORJSONRenderer().render(data, media_type, context),
+                JSONRenderer().render(data, media_type, context),
+            )
+        self.assertIn(b'\n  "slug"', ORJSONRenderer().render(data, 'application/json; indent=2'))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100, COMPRESSION_CACHE_SIZE=2)
+class CompressionMiddlewareTests(TestCase):
+    payload = {'dogs': [{'slug': f'dog-{n}', 'name': f'Dog {n}'} for n in range(50)]}
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def process(self, response, accept_encoding='gzip, br'):
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(self.factory.get('/api/v1/puppies/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def choose(self, accept_encoding):
+        middleware = CompressionMiddleware(lambda request: None)
+        return middleware.choose_encoding(self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_accept_encoding_negotiation(self):
+        self.assertEqual(self.choose('gzip'), 'gzip')
+        self.assertEqual(self.choose('deflate, GZIP;q=0.5'), 'gzip')
+        self.assertIsNone(self.choose(''))
+        self.assertIsNone(self.choose('identity'))
+        self.assertIsNone(self.choose('gzip;q=0'))
+        self.assertIsNone(self.choose('*;q=0'))
+        self.assertIsNone(self.choose('gzip;q=abc'))
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_accept_encoding_negotiation_with_brotli(self):
+        self.assertEqual(self.choose('gzip, br'), 'br')
+        self.assertEqual(self.choose('gzip;q=1.0, br;q=0.5'), 'gzip')
+        self.assertEqual(self.choose('br;q=0, *'), 'gzip')
+        self.assertEqual(self.choose('*'), 'br')
+        self.assertEqual(self.choose('gzip;q=0, *;q=0.1'), 'br')
+
+    def test_json_is_compressed_with_headers(self):
+        response = JsonResponse(self.payload)
+        content = response.content
+        response['ETag'] = '"abc"'
+
+        response = self.process(response, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+        response = JsonResponse(self.payload)
+        response['ETag'] = 'W/"abc"'
+        self.assertEqual(self.process(response, 'gzip')['ETag'], 'W/"abc"')
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.process(JsonResponse(self.payload))
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content)), self.payload)
+
+    def test_small_body_is_not_compressed(self):
+        response = self.process(JsonResponse({'slug': 'rex'}))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        # The representation still depends on Accept-Encoding for larger bodies.
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        with override_settings(COMPRESSION_MIN_SIZE=len(JsonResponse(self.payload).content)):
+            self.assertEqual(self.process(JsonResponse(self.payload), 'gzip')['Content-Encoding'], 'gzip')
+        with override_settings(COMPRESSION_MIN_SIZE=len(JsonResponse(self.payload).content) + 1):
+            self.assertFalse(self.process(JsonResponse(self.payload), 'gzip').has_header('Content-Encoding'))
+
+    def test_non_json_and_streaming_responses_are_left_alone(self):
+        html = HttpResponse('<p>dog</p>' * 100)
+        response = self.process(html)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+
+        streaming = StreamingHttpResponse([b'{"dogs": []}'] * 100, content_type='application/json')
+        response = self.process(streaming)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), b'{"dogs": []}' * 100)
+
+        encoded = JsonResponse(self.payload)
+        encoded['Content-Encoding'] = 'identity'
+        self.assertEqual(self.process(encoded)['Content-Encoding'], 'identity')
+
+    def test_compressed_bodies_are_cached(self):
+        middleware = CompressionMiddleware(lambda request: JsonResponse(self.payload))
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        with mock.patch.object(middleware, 'compress', wraps=middleware.compress) as compress:
+            first, second = middleware(request).content, middleware(request).content
+        self.assertEqual(first, second)
+        compress.assert_called_once()
+
+
+class BatchViewTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Thumbnails are generated from real files when their URL is read.
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        size = DogSize.objects.create(name='Standard')
+        color = DogColor.objects.create(name='Blue')
+
+        def dog(name, gender=Dog.Gender.MALE, role=Dog.Role.PUPPY, litter=None):
+            return Dog.objects.create(name=name, birth_date=date(2020, 1, 1), gender=gender, role=role,
+                                      size=size, color=color, litter=litter, status=Dog.Status.FREE)
+
+        mother = dog('Bella', Dog.Gender.FEMALE, Dog.Role.PRODUCER)
+        father = dog('Rex', role=Dog.Role.PRODUCER)
+        cls.litters = [
+            Litter.objects.create(slug=f'litter-{n}', birth_date=date(2021, n, 1), mother=mother, father=father,
+                                  photo=SimpleUploadedFile(f'litter-{n}.jpg', jpeg()))
+            for n in range(1, 5)
+        ]
+        cls.dogs = [mother, father]
+        for n, litter in enumerate(cls.litters * 2):
+            puppy = dog(f'Puppy {n}', Dog.Gender.FEMALE if n % 2 else Dog.Gender.MALE, litter=litter)
+            DogMedia.objects.create(dog=puppy, file=SimpleUploadedFile('cover.jpg', jpeg()), is_cover=True)
+            DogMedia.objects.create(dog=puppy, file=SimpleUploadedFile('photo.jpg', jpeg()), order=1)
+            cls.dogs.append(puppy)
+
+    def batch(self, dogs=(), litters=()):
+        params = {}
+        if dogs:
+            params['dogs'] = ','.join(dogs)
+        if litters:
+            params['litters'] = ','.join(litters)
+        return self.client.get('/api/v1/batch/', params)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        small = ([self.dogs[2].slug], [self.litters[0].slug])
+        large = ([dog.slug for dog in self.dogs[:5]], [litter.slug for litter in self.litters])
+        self.batch(*large)  # generate thumbnails up front
+
+        for dogs, litters in small, large:
+            with self.assertNumQueries(5):
+                response = self.batch(dogs, litters)
+            self.assertEqual(len(response.json()['dogs']), len(dogs))
+            self.assertEqual(len(response.json()['litters']), len(litters))
+
+    @override_settings(BATCH_MAX_ITEMS=3)
+    def test_item_limit(self):
+        slugs = [dog.slug for dog in self.dogs]
+        self.assertEqual(self.batch(slugs[:2], [self.litters[0].slug]).status_code, 200)
+        # Duplicates count once.
+        self.assertEqual(self.batch(slugs[:3] + slugs[:1]).status_code, 200)
+
+        response = self.batch(slugs[:2], [litter.slug for litter in self.litters[:2]])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('3', response.json()['detail'])
+
+    def test_results_follow_request_order_and_report_missing(self):
+        dogs = [self.dogs[4].slug, 'nobody', self.dogs[0].slug, self.dogs[4].slug]
+        litters = [self.litters[2].slug, 'no-litter', self.litters[0].slug]
+        response = self.batch(dogs, litters).json()
+        # Repeated parameters are the same as a comma-separated list.
+        self.assertEqual(self.client.get('/api/v1/batch/', {'dogs': dogs, 'litters': litters}).json(), response)
+
+        self.assertEqual([dog['slug'] for dog in response['dogs']], [self.dogs[4].slug, self.dogs[0].slug])
+        self.assertEqual([litter['slug'] for litter in response['litters']],
+                         [self.litters[2].slug, self.litters[0].slug])
+        self.assertEqual(response['not_found'], {'dogs': ['nobody'], 'litters': ['no-litter']})
+
+    def test_payloads_match_detail_endpoints(self):
+        dogs = [dog.slug for dog in self.dogs[:4]]
+        litters = [litter.slug for litter in self.litters[:2]]
+        response = self.batch(dogs, litters).json()
+
+        self.assertEqual(response['dogs'], [self.client.get(f'/api/v1/dogs/{slug}/').json() for slug in dogs])
+        self.assertEqual(response['litters'],
+                         [self.client.get(f'/api/v1/litters/{slug}/').json() for slug in litters])
+
+
+class PedigreeGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.size = DogSize.objects.create(name='Standard')
+        cls.color = DogColor.objects.create(name='Blue')
+
+    def make_dog(self, name, gender, litter=None):
+        return Dog.objects.create(
+            name=name,
+            birth_date=date(2020, 1, 1),
+            gender=gender,
+            role=Dog.Role.PRODUCER,
+            size=self.size,
+            color=self.color,
+            litter=litter,
+        )
+
+    def make_litter(self, mother, father):
+        return Litter.objects.create(slug=f'{mother.slug}-{father.slug}', birth_date=date(2021, 1, 1),
+                                     mother=mother, father=father)
+
+    def test_full_siblings(self):
+        sire = self.make_dog('Sire', Dog.Gender.MALE)
+        dam = self.make_dog('Dam', Dog.Gender.FEMALE)
+        litter = self.make_litter(dam, sire)
+        brother = self.make_dog('Brother', Dog.Gender.MALE, litter)
+        sister = self.make_dog('Sister', Dog.Gender.FEMALE, litter)
+        puppy = self.make_dog('Puppy', Dog.Gender.MALE, self.make_litter(sister, brother))
+
+        graph = PedigreeGraph()
+        self.assertEqual(graph.kinship(brother.pk, sister.pk), 0.25)
+        self.assertEqual(graph.inbreeding(puppy.pk), 0.25)
+        self.assertEqual(graph.inbreeding(brother.pk), 0.0)
+
+    def test_line_breeding_with_descendant_loaded_first(self):
+        # X gets the lowest id, so it is visited before its sire and dam.
+        x = self.make_dog('X', Dog.Gender.MALE)
+        a = self.make_dog('A', Dog.Gender.MALE)
+        m = self.make_dog('M', Dog.Gender.FEMALE)
+        b = self.make_dog('B', Dog.Gender.FEMALE, self.make_litter(m, a))
+        x.litter = self.make_litter(b, a)
+        x.save()
+
+        graph = PedigreeGraph()
+        self.assertEqual(graph.kinship(a.pk, b.pk), 0.25)
+        self.assertEqual(graph.inbreeding(x.pk), 0.25)
+        self.assertEqual(graph.kinship_matrix([a.pk, b.pk]), [[0.5, 0.25], [0.25, 0.5]])
+
+    def test_cycle_is_cut(self):
+        a = self.make_dog('A', Dog.Gender.MALE)
+        b = self.make_dog('B', Dog.Gender.FEMALE)
+        litter = self.make_litter(b, a)
+        a.litter = litter
+        a.save()
+
+        graph = PedigreeGraph()
+        self.assertEqual(graph.inbreeding(a.pk), 0.0)
+
+    def test_matrix_matches_recursive_definition(self):
+        pedigree = synthetic_graph(generations=6, per_generation=40, seed=3)
+        memo = {}
+
+        def kinship(a, b):
+            if a == NO_PARENT or b == NO_PARENT:
+                return 0.0
+            if (a, b) not in memo:
+                if a == b:
+                    memo[a, b] = 0.5 * (1 + kinship(pedigree.sires[a], pedigree.dams[a]))
+                else:
+                    if pedigree.generations[a] < pedigree.generations[b]:
+                        a, b = b, a
+                    memo[a, b] = 0.5 * (kinship(pedigree.sires[a], b) + kinship(pedigree.dams[a], b))
+            return memo[a, b]
+
+        producers = list(pedigree.dog_ids[::8]) + [0]
+        matrix = pedigree.kinship_matrix(producers)
+        for x, dog_a in enumerate(producers[:-1]):
+            for y, dog_b in enumerate(producers[:-1]):
+                expected = kinship(pedigree.index[dog_a], pedigree.index[dog_b])
+                self.assertAlmostEqual(matrix[x][y], expected, places=12)
+            self.assertAlmostEqual(
+                pedigree.inbreeding(dog_a),
+                kinship(pedigree.sires[pedigree.index[dog_a]], pedigree.dams[pedigree.index[dog_a]]),
+                places=12,
+            )
+        self.assertEqual(matrix[-1], [0.0] * (len(producers) - 1) + [0.5])
+
+    def test_matrix_for_thousands_of_dogs_takes_under_a_second(self):
+        pedigree = synthetic_graph()
+        producers = list(pedigree.dog_ids[::10])
+        self.assertGreater(len(pedigree.dog_ids), 4000)
+
+        start = time.perf_counter()
+        pedigree.kinship_matrix(producers)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_update_without_lineage_change_is_a_no_op(self):
+        dog = self.make_dog('Rex', Dog.Gender.MALE)
+        graph.load()
+        with mock.patch.object(graph, '_compute_generations') as compute:
+            with self.captureOnCommitCallbacks(execute=True):
+                dog.description = 'Good boy'
+                dog.save()
+        compute.assert_not_called()
+
+    def test_reloads_after_write_in_another_process(self):
+        sire = self.make_dog('Sire', Dog.Gender.MALE)
+        dam = self.make_dog('Dam', Dog.Gender.FEMALE)
+        brother = self.make_dog('Brother', Dog.Gender.MALE)
+        sister = self.make_dog('Sister', Dog.Gender.FEMALE)
+        pedigree = PedigreeGraph()
+        pedigree.load()
+
+        # The signals only patch the module-level graph, like another worker.
+        with self.captureOnCommitCallbacks(execute=True):
+            litter = self.make_litter(dam, sire)
+            for dog in (brother, sister):
+                dog.litter = litter
+                dog.save()
+        self.assertEqual(pedigree.kinship(brother.pk, sister.pk), 0.25)
+
+    def test_reloads_when_a_requested_dog_is_missing(self):
+        pedigree = PedigreeGraph()
+        pedigree.load()
+        # Fixtures and other raw writes don't show up in the change feed.
+        with mock.patch('kennel.signals.record_change'):
+            sire = self.make_dog('Sire', Dog.Gender.MALE)
+            dam = self.make_dog('Dam', Dog.Gender.FEMALE)
+            puppy = self.make_dog('Puppy', Dog.Gender.MALE, self.make_litter(dam, sire))
+        self.assertEqual(pedigree.kinship(puppy.pk, sire.pk), 0.25)
+
+    def test_signals_patch_graph_after_commit(self):
+        sire = self.make_dog('Sire', Dog.Gender.MALE)
+        dam = self.make_dog('Dam', Dog.Gender.FEMALE)
+        graph.load()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            litter = self.make_litter(dam, sire)
+            brother = self.make_dog('Brother', Dog.Gender.MALE, litter)
+            sister = self.make_dog('Sister', Dog.Gender.FEMALE, litter)
+        self.assertEqual(graph.kinship(brother.pk, sister.pk), 0.25)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.make_dog('Rolled back', Dog.Gender.MALE, litter)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(len(graph.dog_ids), 4)
+
+
+class ChangeFeedTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.size = DogSize.objects.create(name='Standard')
+        cls.color = DogColor.objects.create(name='Blue')
+
+    def make_dog(self, name):
+        return Dog.objects.create(name=name, birth_date=date(2020, 1, 1), gender=Dog.Gender.MALE,
+                                  role=Dog.Role.PUPPY, size=self.size, color=self.color)
+
+    def test_events_in_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rex = self.make_dog('Rex')
+        with self.captureOnCommitCallbacks(execute=True):
+            max_ = self.make_dog('Max')
+            rex.delete()
+
+        response = self.client.get('/api/v1/changes/')
+        events = response.json()['events']
+        self.assertEqual(
+            [(event['op'], event['model'], event['slug']) for event in events],
+            [('upsert', 'dog', 'rex'), ('upsert', 'dog', 'max'), ('delete', 'dog', 'rex')],
+        )
+        self.assertEqual(response.json()['cursor'], events[-1]['cursor'])
+
+        response = self.client.get('/api/v1/changes/', {'since': events[0]['cursor'], 'limit': 1})
+        self.assertEqual(response.json()['events'][0]['id'], max_.pk)
+        self.assertTrue(response.json()['more'])
+
+    def test_changes_get_cursors_only_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.make_dog('Rex')
+        change = Change.objects.get()
+        self.assertIsNone(change.cursor)
+        self.assertEqual(self.client.get('/api/v1/changes/').json()['events'], [])
+
+        # Whichever commit numbers first takes every committed change along.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_dog('Max')
+        self.assertEqual(list(Change.objects.values_list('slug', 'cursor')), [('rex', 1), ('max', 2)])
+        callbacks[0]()
+        self.assertEqual(list(Change.objects.values_list('cursor', flat=True)), [1, 2])
+
+    def test_cursor_from_another_database_is_gone(self):
+        response = self.client.get('/api/v1/changes/', {'since': 5})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['cursor'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_dog('Rex')
+        response = self.client.get('/api/v1/changes/', {'since': 5})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['cursor'], 1)
+        self.assertEqual(self.client.get('/api/v1/changes/', {'since': 1}).status_code, 200)
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        try:
+            with transaction.atomic():
+                self.make_dog('Ghost')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Change.objects.exists())
+
+    @override_settings(CHANGES_POLL_INTERVAL=0.01)
+    def test_wait_times_out_empty(self):
+        response = self.client.get('/api/v1/changes/', {'since': 0, 'wait': 1})
+        self.assertEqual(response.json(), {'cursor': 0, 'more': False, 'events': []})
+
+    @override_settings(CHANGES_MAX_WAITERS=0)
+    def test_waiters_are_capped(self):
+        response = self.client.get('/api/v1/changes/', {'wait': 5})
+        self.assertEqual(response.json()['events'], [])
+        self.assertIn('Retry-After', response)
+
+
+class BootTests(TestCase):
+    def test_warm_worker_runs_catalog_querysets(self):
+        from config import boot
+
+        with self.assertNumQueries(6):
+            boot.warm_worker()
+
+
+def jpeg(size=(64, 48), orientation=None):
+    buffer = BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class ImageNormalizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        size = DogSize.objects.create(name='Standard')
+        color = DogColor.objects.create(name='Blue')
+        cls.dog = Dog.objects.create(name='Rex', birth_date=date(2020, 1, 1), gender=Dog.Gender.MALE,
+                                     role=Dog.Role.PUPPY, size=size, color=color)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def png(self, mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, (16, 16), (255, 0, 0, 128) if mode == 'RGBA' else 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    @override_settings(MEDIA_MAX_DIMENSION=32)
+    def test_image_is_turned_upright_and_capped(self):
+        content, extension = normalize_image(BytesIO(jpeg((64, 48), orientation=6)))
+        self.assertEqual(extension, 'jpg')
+        with Image.open(content) as image:
+            self.assertEqual(image.size, (24, 32))
+
+    def test_metadata_is_stripped(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x0112] = 1
+        Image.new('RGB', (16, 16)).save(buffer, 'JPEG', exif=exif, comment=b'secret')
+        content, _ = normalize_image(buffer)
+        with Image.open(content) as image:
+            self.assertEqual(dict(image.getexif()), {})
+            self.assertNotIn('exif', image.info)
+            self.assertNotIn('comment', image.info)
+
+    def test_transparent_image_stays_png(self):
+        content, extension = normalize_image(BytesIO(self.png()))
+        self.assertEqual(extension, 'png')
+        with Image.open(content) as image:
+            self.assertEqual((image.format, image.mode), ('PNG', 'RGBA'))
+
+        _, extension = normalize_image(BytesIO(self.png('RGB')))
+        self.assertEqual(extension, 'jpg')
+
+    def test_non_image_is_left_alone(self):
+        self.assertIsNone(normalize_image(BytesIO(b'%PDF-1.4 not an image')))
+
+    def test_upload_is_normalized_once(self):
+        content = jpeg(orientation=6)
+        media = DogMedia.objects.create(dog=self.dog, file=SimpleUploadedFile('photo.jpeg', content))
+        self.assertEqual(media.original_size, len(content))
+        self.assertTrue(media.file.name.endswith('.jpg'))
+        with media.file.open('rb'), Image.open(media.file) as image:
+            self.assertEqual(image.size, (48, 64))
+            self.assertNotIn(0x0112, image.getexif())
+
+        name = media.file.name
+        with mock.patch('kennel.models.normalize_upload') as normalize_upload:
+            media.order = 1
+            media.save()
+            DogMedia.objects.get(pk=media.pk).save()
+        normalize_upload.assert_not_called()
+        media.refresh_from_db()
+        self.assertEqual((media.file.name, media.original_size), (name, len(content)))
+
+    def test_litter_photo_is_normalized_once(self):
+        mother = Dog.objects.create(name='Bella', birth_date=date(2019, 1, 1), gender=Dog.Gender.FEMALE,
+                                    role=Dog.Role.PRODUCER, size=self.dog.size, color=self.dog.color)
+        content = self.png()
+        litter = Litter.objects.create(slug='bella-rex', birth_date=date(2021, 1, 1), mother=mother,
+                                       father=self.dog, photo=SimpleUploadedFile('litter.png', content))
+        self.assertEqual(litter.photo_original_size, len(content))
+        self.assertTrue(litter.photo.name.endswith('.png'))
+
+        with mock.patch('kennel.models.normalize_upload') as normalize_upload:
+            Litter.objects.get(pk=litter.pk).save()
+        normalize_upload.assert_not_called()
+
+    def test_normalizemedia_picks_up_rows_without_original_size(self):
+        pending = self.stored_media(jpeg())
+        done = self.stored_media(jpeg())
+        DogMedia.objects.filter(pk=done.pk).update(original_size=123)
+        DogMedia.objects.create(dog=self.dog, file='dogs/rex/videos/clip.mp4', media_type=DogMedia.MediaType.VIDEO)
+
+        with mock.patch('kennel.management.commands.normalizemedia.normalize') as normalize:
+            call_command('normalizemedia', stdout=StringIO())
+        normalize.assert_called_once_with(DogMedia, pending.pk, 'file', 'original_size')
+
+    def stored_media(self, content):
+        # A committed name, as left by a direct upload or an older release.
+        name = default_storage.save('dogs/rex/images/photo.jpg', ContentFile(content))
+        return DogMedia.objects.create(dog=self.dog, file=name)
+
+    def test_stored_file_is_replaced_after_commit(self):
+        media = self.stored_media(jpeg())
+        old_name = media.file.name
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            normalize_on_commit(media, 'file', 'original_size')
+        media.refresh_from_db()
+        self.assertIsNone(media.original_size)
+
+        with self.captureOnCommitCallbacks() as deletes:
+            callbacks[0]()
+        media.refresh_from_db()
+        self.assertNotEqual(media.file.name, old_name)
+        self.assertTrue(default_storage.exists(old_name))
+
+        for callback in deletes:
+            callback()
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(media.file.name))
+
+    def test_failed_save_keeps_original(self):
+        media = self.stored_media(jpeg())
+        old_name = media.file.name
+        before = set(default_storage.listdir('dogs/rex/images')[1])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            normalize_on_commit(media, 'file', 'original_size')
+        with mock.patch.object(DogMedia, 'save', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            callbacks[0]()
+        self.assertTrue(default_storage.exists(old_name))
+        self.assertEqual(set(default_storage.listdir('dogs/rex/images')[1]), before)
+
+
+class UploadTokenTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        size = DogSize.objects.create(name='Standard')
+        color = DogColor.objects.create(name='Blue')
+        cls.rex, cls.max = (
+            Dog.objects.create(name=name, birth_date=date(2020, 1, 1), gender=Dog.Gender.MALE,
+                               role=Dog.Role.PUPPY, size=size, color=color)
+            for name in ('Rex', 'Max')
+        )
+
+    def test_token_is_bound_to_target_and_dog(self):
+        token = issue_upload_token('dogs/rex/images/photo.jpg', 'dog_media', self.rex)
+        self.assertEqual(issued_name(token, 'dog_media', self.rex), 'dogs/rex/images/photo.jpg')
+        self.assertIsNone(issued_name(token, 'dog_media', self.max))
+        self.assertIsNone(issued_name(token, 'litter_photo'))
+        self.assertIsNone(issued_name(token[:-1] + ('A' if token[-1] != 'A' else 'B'), 'dog_media', self.rex))
+        with override_settings(DIRECT_UPLOAD_EXPIRES=-1):
+            self.assertIsNone(issued_name(token, 'dog_media', self.rex))
+
+    def test_reserved_names_are_unique_and_fit(self):
+        field = DogMedia._meta.get_field('file')
+        media = DogMedia(dog=self.rex)
+        first, second = (reserve_name(field, media, 'photo.jpg') for _ in range(2))
+        self.assertNotEqual(first, second)
+        self.assertRegex(first, r'^dogs/rex/images/photo_[0-9a-f]{32}\.jpg$')
+
+        long_name = reserve_name(field, media, 'x' * 200 + '.jpeg')
+        self.assertEqual(len(long_name), field.max_length)
+        self.assertTrue(long_name.endswith('.jpeg'))
+
+    def test_complete_rejects_plain_name(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/api/v1/uploads/complete/', {
+            'dog': self.rex.pk, 'token': 'dogs/rex/images/photo.jpg',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('token', response.json())
+        self.assertFalse(DogMedia.objects.exists())
+
+
+S3_TEST_ENDPOINT_URL = os.environ.get('S3_TEST_ENDPOINT_URL')
+
+
+@skipUnless(S3_TEST_ENDPOINT_URL, 'set S3_TEST_ENDPOINT_URL, e.g. to the MinIO from compose.s3.yaml')
+@override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'storages.backends.s3.S3Storage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    AWS_STORAGE_BUCKET_NAME='kennel-test',
+    AWS_S3_ACCESS_KEY_ID=os.environ.get('S3_TEST_ACCESS_KEY', 'minioadmin'),
+    AWS_S3_SECRET_ACCESS_KEY=os.environ.get('S3_TEST_SECRET_KEY', 'minioadmin'),
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ENDPOINT_URL=S3_TEST_ENDPOINT_URL,
+    AWS_S3_PUBLIC_ENDPOINT_URL=None,
+    AWS_S3_ADDRESSING_STYLE='path',
+    AWS_QUERYSTRING_AUTH=False,
+    AWS_S3_FILE_OVERWRITE=False,
+)
+class DirectUploadTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        size = DogSize.objects.create(name='Standard')
+        color = DogColor.objects.create(name='Blue')
+        cls.dog = Dog.objects.create(name='Rex', birth_date=date(2020, 1, 1), gender=Dog.Gender.MALE,
+                                     role=Dog.Role.PUPPY, size=size, color=color)
+
+    def setUp(self):
+        presign_client.cache_clear()
+        self.addCleanup(presign_client.cache_clear)
+        client = presign_client()
+        if not any(bucket['Name'] == 'kennel-test' for bucket in client.list_buckets()['Buckets']):
+            client.create_bucket(Bucket='kennel-test')
+        self.client.force_login(self.admin)
+
+    def assertNormalized(self, field_file, size):
+        with field_file.open('rb'), Image.open(field_file) as image:
+            self.assertEqual(image.size, size)
+            self.assertNotIn(0x0112, image.getexif())
+
+    def upload(self, target, filename, content, **extra):
+        response = self.client.post('/api/v1/uploads/', {
+            'target': target, 'filename': filename, 'content_type': 'image/jpeg', **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        presigned = response.json()
+        stored = urllib3.request('POST', presigned['url'], fields={
+            **presigned['fields'], 'file': (filename, content, 'image/jpeg'),
+        })
+        self.assertLess(stored.status, 300, stored.data)
+        return presigned['name'], presigned['token']
+
+    def test_admin_form_attaches_uploaded_file(self):
+        name, token = self.upload('dog_media', 'photo.jpg', jpeg(), dog=self.dog.pk)
+        self.assertTrue(name.startswith('dogs/rex/images/'))
+
+        response = self.client.get('/admin/kennel/dogmedia/add/')
+        self.assertContains(response, 'data-direct-upload="dog_media"')
+        self.assertContains(response, 'kennel/admin/direct_upload.js')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/admin/kennel/dogmedia/add/', {
+                'dog': self.dog.pk, 'media_type': 'image', 'order': 0, 'upload_token': token,
+            })
+        self.assertEqual(response.status_code, 302)
+        media = DogMedia.objects.get(dog=self.dog)
+        self.assertIsNotNone(media.original_size)
+
+    def test_admin_form_rejects_existing_file_not_issued(self):
+        name = default_storage.save('dogs/rex/images/existing.jpg', ContentFile(jpeg()))
+        token = issue_upload_token(name, 'dog_media', self.dog)
+        forged = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        response = self.client.post('/admin/kennel/dogmedia/add/', {
+            'dog': self.dog.pk, 'media_type': 'image', 'order': 0, 'upload_token': forged,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DogMedia.objects.exists())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_complete_endpoint_creates_normalized_media(self):
+        content = jpeg(orientation=6)
+        name, token = self.upload('dog_media', 'photo.jpg', content, dog=self.dog.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/uploads/complete/', {
+                'dog': self.dog.pk, 'token': token, 'is_cover': True,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        media = DogMedia.objects.get(dog=self.dog)
+        self.assertTrue(media.is_cover)
+        self.assertEqual(media.original_size, len(content))
+        self.assertNormalized(media.file, (48, 64))
+        self.assertFalse(default_storage.exists(name))
+
+
+class ReplicaStickinessTests(TestCase):
+    def setUp(self):
+        self.middleware = ReplicaStickinessMiddleware(lambda request: HttpResponse())
+        self.factory = RequestFactory()
+
+    def test_forged_cookie_does_not_pin(self):
+        request = self.factory.get('/api/v1/puppies/')
+        request.COOKIES['primary_pin'] = '1e12'
+        self.assertFalse(self.middleware.is_pinned(request))
+
+    def test_signed_cookie_pins_until_it_expires(self):
+        response = HttpResponse()
+        response.set_signed_cookie('primary_pin', '1', salt=ReplicaStickinessMiddleware.cookie_salt)
+        request = self.factory.get('/api/v1/puppies/')
+        request.COOKIES['primary_pin'] = response.cookies['primary_pin'].value
+        self.assertTrue(self.middleware.is_pinned(request))
+
+        with override_settings(REPLICA_STICKY_SECONDS=-1):
+            self.assertFalse(self.middleware.is_pinned(request))
+
+    def test_write_sets_secure_signed_cookie(self):
+        def view(request):
+            wrote_to_primary.set(True)
+            return HttpResponse()
+
+        response = ReplicaStickinessMiddleware(view)(self.factory.get('/'))
+        cookie = response.cookies['primary_pin']
+        self.assertTrue(cookie['secure'])
+        self.assertNotEqual(cookie.value, '1')
+
+
+class PrimaryReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        for var in (pinned_to_primary, wrote_to_primary):
+            self.addCleanup(var.reset, var.set(False))
+        # A stub alias: the lag probe is mocked, so it is never connected to.
+        self.enterContext(mock.patch.dict(settings.DATABASES, {routers.REPLICA: settings.DATABASES['default']}))
+        self.enterContext(mock.patch.dict(routers._lag, {'checked_at': None, 'seconds': None}))
+        self.replica_lag = self.enterContext(mock.patch('kennel.routers.replica_lag', return_value=0.0))
+
+    def test_reads_outside_replica_reads_stay_on_primary(self):
+        self.assertEqual(self.router.db_for_read(Dog), 'default')
+        self.replica_lag.assert_not_called()
+
+    def test_replica_reads_use_replica_until_the_request_writes(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Dog), routers.REPLICA)
+            self.assertEqual(self.router.db_for_write(Dog), 'default')
+            self.assertEqual(self.router.db_for_read(Dog), 'default')
+
+    def test_pinned_client_reads_from_primary(self):
+        pinned_to_primary.set(True)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Dog), 'default')
+
+    @override_settings(REPLICA_MAX_LAG=5.0)
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.replica_lag.return_value = 12.0
+        with replica_reads(), self.assertLogs('kennel.routers', 'WARNING'):
+            self.assertEqual(self.router.db_for_read(Dog), 'default')
+
+    def test_unreachable_replica_falls_back_and_is_rechecked_later(self):
+        self.replica_lag.side_effect = OperationalError('timeout expired')
+        with replica_reads():
+            with self.assertLogs('kennel.routers', 'WARNING'):
+                self.assertEqual(self.router.db_for_read(Dog), 'default')
+            # Within REPLICA_LAG_CHECK_INTERVAL the last result is reused.
+            self.assertEqual(self.router.db_for_read(Dog), 'default')
+            self.assertEqual(self.replica_lag.call_count, 1)
+
+            self.replica_lag.side_effect = None
+            routers._lag['checked_at'] -= settings.REPLICA_LAG_CHECK_INTERVAL + 1
+            self.assertEqual(self.router.db_for_read(Dog), routers.REPLICA)
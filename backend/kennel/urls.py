@@ -1,11 +1,18 @@
 from django.urls import path
-from .views import DogDetailView, PuppyListView, ProducerListView, GraduateListView, LitterDetailView, LitterListView
+from .views import (DogDetailView, PuppyListView, ProducerListView, GraduateListView, LitterDetailView, LitterListView,
+                    ProducerKinshipView, BatchView, DirectUploadView, DirectUploadCompleteView,
+                    ChangeFeedView)
 
 urlpatterns = [
     path('dogs/<slug:slug>/', DogDetailView.as_view()),
     path('puppies/', PuppyListView.as_view()),
     path('producers/', ProducerListView.as_view()),
+    path('producers/kinship/', ProducerKinshipView.as_view()),
     path('graduates/', GraduateListView.as_view()),
     path('litters/<slug:slug>/', LitterDetailView.as_view()),
     path('litters/', LitterListView.as_view()),
+    path('batch/', BatchView.as_view()),
+    path('uploads/', DirectUploadView.as_view(), name='direct-upload'),
+    path('uploads/complete/', DirectUploadCompleteView.as_view()),
+    path('changes/', ChangeFeedView.as_view()),
 ]
@@ -1,14 +1,35 @@
-from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.generics import GenericAPIView, ListAPIView, RetrieveAPIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Count, Q, Prefetch
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Min, Q, Prefetch
 
-from .models import Dog, Litter, DogMedia
-from .serializers import DogListSerializer, DogDetailSerializer, LitterListSerializer, LitterDetailSerializer
+from .models import Change, Dog, Litter, DogMedia
+from .serializers import (DogListSerializer, DogDetailSerializer, DogShortSerializer, LitterListSerializer,
+                          LitterDetailSerializer, DogMediaSerializer, DirectUploadSerializer,
+                          DirectUploadCompleteSerializer, ChangeSerializer)
 from .paginations import DogPagination
+from .feed import notifier
+from .images import normalize_on_commit
+from .pedigree import graph
+from .routers import replica_reads
+from .storage import issue_upload_token, presign_upload, reserve_name, supports_direct_upload
 
 
-class BaseDogListView(ListAPIView):
+class ReplicaReadMixin:
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class BaseDogListView(ReplicaReadMixin, ListAPIView):
     serializer_class = DogListSerializer
     pagination_class = DogPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
@@ -32,7 +53,7 @@ class BaseDogListView(ListAPIView):
         )
 
 
-class DogDetailView(RetrieveAPIView):
+class DogDetailView(ReplicaReadMixin, RetrieveAPIView):
     queryset = Dog.objects.select_related(
         'size',
         'color',
@@ -69,14 +90,14 @@ class ProducerListView(BaseDogListView):
         )
 
 
-class LitterListView(ListAPIView):
+class LitterListView(ReplicaReadMixin, ListAPIView):
     queryset = Litter.objects.annotate(puppies_count_db=Count('puppies'),
                                        males_count_db=Count('puppies', filter=Q(puppies__gender='male')),
                                        females_count_db=Count('puppies', filter=Q(puppies__gender='female'))).all()
     serializer_class = LitterListSerializer
 
 
-class LitterDetailView(RetrieveAPIView):
+class LitterDetailView(ReplicaReadMixin, RetrieveAPIView):
     queryset = (
         Litter.objects
         .annotate(
@@ -94,3 +115,195 @@ class LitterDetailView(RetrieveAPIView):
     )
     serializer_class = LitterDetailSerializer
     lookup_field = 'slug'
+
+
+class ProducerKinshipView(GenericAPIView):
+    queryset = Dog.objects.filter(role='producer').order_by('name')
+    serializer_class = DogShortSerializer
+
+    def get(self, request, *args, **kwargs):
+        producers = list(self.get_queryset())
+        ids = [dog.pk for dog in producers]
+        matrix = graph.kinship_matrix(ids)
+        return Response({
+            'producers': self.get_serializer(producers, many=True).data,
+            # A dog's kinship with itself is (1 + its own COI) / 2.
+            'inbreeding': [round(2 * matrix[n][n] - 1, 6) for n in range(len(ids))],
+            'coi': [[round(value, 6) for value in row] for row in matrix],
+        })
+
+
+class BatchView(ReplicaReadMixin, GenericAPIView):
+    """Several dogs and litters in one round trip.
+
+    ``?dogs=a,b&litters=c`` returns the same shapes as the detail endpoints,
+    in request order, loaded with a fixed number of queries.
+    """
+    queryset = Dog.objects.all()
+
+    def get_slugs(self, param):
+        slugs = []
+        for value in self.request.query_params.getlist(param):
+            slugs.extend(slug.strip() for slug in value.split(',') if slug.strip())
+        return list(dict.fromkeys(slugs))
+
+    def get(self, request, *args, **kwargs):
+        dog_slugs = self.get_slugs('dogs')
+        litter_slugs = self.get_slugs('litters')
+
+        limit = settings.BATCH_MAX_ITEMS
+        if len(dog_slugs) + len(litter_slugs) > limit:
+            raise ValidationError({'detail': f'At most {limit} dogs and litters can be requested at once.'})
+
+        dogs = {}
+        if dog_slugs:
+            dogs = {dog.slug: dog for dog in DogDetailView.queryset.filter(slug__in=dog_slugs)}
+
+        litters = {}
+        if litter_slugs:
+            queryset = (
+                LitterDetailView.queryset
+                .select_related('mother', 'father')
+                .filter(slug__in=litter_slugs)
+                .order_by('id')
+            )
+            for litter in queryset:
+                litters.setdefault(litter.slug, litter)
+
+        context = self.get_serializer_context()
+        return Response({
+            'dogs': DogDetailSerializer(
+                [dogs[slug] for slug in dog_slugs if slug in dogs], many=True, context=context
+            ).data,
+            'litters': LitterDetailSerializer(
+                [litters[slug] for slug in litter_slugs if slug in litters], many=True, context=context
+            ).data,
+            'not_found': {
+                'dogs': [slug for slug in dog_slugs if slug not in dogs],
+                'litters': [slug for slug in litter_slugs if slug not in litters],
+            },
+        })
+
+
+class DirectUploadView(GenericAPIView):
+    """Presigned POST for uploading media straight to object storage.
+
+    The client posts the file to ``url`` with ``fields`` and then hands the
+    returned ``token`` either to ``DirectUploadCompleteView`` or, in the
+    admin, to the form's ``upload_token`` field; the token proves the
+    server reserved ``name`` for this upload.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = DirectUploadSerializer
+
+    def post(self, request, *args, **kwargs):
+        if not supports_direct_upload():
+            return Response({'detail': 'Direct uploads need object storage.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if data['target'] == 'dog_media':
+            instance = DogMedia(dog=data['dog'], media_type=data['media_type'])
+            name = reserve_name(DogMedia._meta.get_field('file'), instance, data['filename'])
+        else:
+            name = reserve_name(Litter._meta.get_field('photo'), Litter(), data['filename'])
+
+        return Response({
+            'name': name,
+            'token': issue_upload_token(name, data['target'], data.get('dog')),
+            **presign_upload(name, data.get('content_type')),
+        })
+
+
+class DirectUploadCompleteView(GenericAPIView):
+    permission_classes = [IsAdminUser]
+    serializer_class = DirectUploadCompleteSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        if not default_storage.exists(data['name']):
+            raise ValidationError({'name': 'File has not been uploaded.'})
+
+        if data.get('dog'):
+            media = DogMedia.objects.create(
+                dog=data['dog'],
+                file=data['name'],
+                media_type=data['media_type'],
+                is_cover=data['is_cover'],
+                order=data['order'],
+            )
+            # Committed names skip the upload-time normalization in save().
+            if media.media_type == DogMedia.MediaType.IMAGE:
+                normalize_on_commit(media, 'file', 'original_size')
+            return Response(DogMediaSerializer(media).data, status=status.HTTP_201_CREATED)
+
+        litter = data['litter']
+        litter.photo = data['name']
+        litter.save(update_fields=['photo'])
+        normalize_on_commit(litter, 'photo', 'photo_original_size')
+        return Response(LitterListSerializer(litter, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class ChangeFeedView(GenericAPIView):
+    """Ordered upsert/delete events after ``since``.
+
+    With ``wait`` (seconds) the request is held open until an event arrives
+    or the wait runs out; when the worker already has too many waiting
+    requests it answers at once with ``Retry-After``. ``cursor`` in the
+    response is what to pass as ``since`` next; a 410 means ``since`` was
+    pruned or comes from a reset or restored database, and the client has
+    to refetch the catalog and continue from the returned cursor.
+    """
+    queryset = Change.objects.all()
+    serializer_class = ChangeSerializer
+
+    def get_int_param(self, name, default, maximum=None):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: 'A non-negative integer is required.'})
+        if value < 0:
+            raise ValidationError({name: 'A non-negative integer is required.'})
+        return min(value, maximum) if maximum is not None else value
+
+    def get(self, request, *args, **kwargs):
+        since = self.get_int_param('since', 0)
+        limit = self.get_int_param('limit', settings.CHANGES_PAGE_SIZE, settings.CHANGES_PAGE_SIZE) or 1
+        wait = self.get_int_param('wait', 0, settings.CHANGES_MAX_WAIT)
+
+        if since:
+            bounds = Change.objects.aggregate(oldest=Min('cursor'), latest=Max('cursor'))
+            # Past the newest cursor means the cursor came from a database
+            # that has since been reset or restored from a backup.
+            if bounds['latest'] is None or not bounds['oldest'] - 1 <= since <= bounds['latest']:
+                return Response({'detail': 'Cursor is no longer available.', 'cursor': bounds['latest'] or 0},
+                                status=status.HTTP_410_GONE)
+
+        def fetch():
+            return list(Change.objects.filter(cursor__gt=since).order_by('cursor')[:limit + 1])
+
+        changes = fetch()
+        retry_after = None
+        if not changes and wait:
+            changes = notifier.wait(since, wait, fetch)
+            if changes is None:
+                # Too many clients already waiting in this worker; answer
+                # right away and let the client come back.
+                changes, retry_after = [], settings.CHANGES_RETRY_AFTER
+
+        more = len(changes) > limit
+        changes = changes[:limit]
+        response = Response({
+            'cursor': changes[-1].cursor if changes else since,
+            'more': more,
+            'events': self.get_serializer(changes, many=True).data,
+        })
+        if retry_after is not None:
+            response['Retry-After'] = str(retry_after)
+        return response
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Clone the primary on first start, then run as a hot standby.
+set -e
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+  until pg_basebackup -h postgres -U "$POSTGRES_USER" -D "$PGDATA" -R -X stream; do
+    sleep 2
+  done
+  chmod 700 "$PGDATA"
+fi
+exec postgres